@@ -1,13 +1,33 @@
 import os
-import pandas as pd
-
-
-def load_patient_ids_from_excel(excel_path: str) -> pd.DataFrame:
-    """从 Excel 读取患者号，同时保留行号"""
-    df = pd.read_excel(excel_path, dtype=str)
-    df = df.fillna("")
-    df["行号"] = df.index + 2  # Excel 行号（+2 是因为 index 从 0 开始，第一行是表头）
-    return df
+from openpyxl import load_workbook
+
+
+def _cell_str(row: tuple, i: int) -> str:
+    """空单元格记为空串，整数值的浮点数按整数输出（与原 dtype=str + fillna("") 一致）"""
+    v = row[i] if i < len(row) else None
+    if v is None:
+        return ""
+    if isinstance(v, float) and v.is_integer():
+        v = int(v)
+    return str(v)
+
+
+def load_patient_ids_from_excel(excel_path: str) -> list:
+    """从 Excel 第一个工作表读取患者行（以表头为键），同时保留行号"""
+    wb = load_workbook(excel_path, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = ["" if h is None else str(h) for h in next(rows, ())]
+        records = []
+        for row_no, row in enumerate(rows, start=2):  # Excel 行号（第一行是表头）
+            if all(v is None for v in row):
+                continue
+            record = {h: _cell_str(row, i) for i, h in enumerate(header)}
+            record["行号"] = row_no
+            records.append(record)
+    finally:
+        wb.close()
+    return records
 
 
 def load_patient_ids_from_full(full_dir: str) -> set:
@@ -21,23 +41,24 @@ def load_patient_ids_from_full(full_dir: str) -> set:
     return patient_ids
 
 
-def check_missing_patients(df: pd.DataFrame, full_ids: set):
+def check_missing_patients(records: list, full_ids: set):
     """比对并输出缺失患者（带 Excel 行号）"""
-    excel_ids = set(df["住院流水号"].unique())
+    excel_ids = {r["住院流水号"] for r in records}
     missing = excel_ids - full_ids
     extra = full_ids - excel_ids
 
     print("\n📊 缺失排查结果：")
-    print(f"Excel 共 {len(df)} 行数据")
+    print(f"Excel 共 {len(records)} 行数据")
     print(f"Excel 去重后 {len(excel_ids)} 个患者")
     print(f"全量目录 {len(full_ids)} 个患者")
     print(f"缺失 {len(missing)} 个患者")
 
     if missing:
         print("⚠️ 缺失的患者号及所在 Excel 行号：")
-        miss_df = df[df["住院流水号"].isin(missing)]
-        for _, row in miss_df.iterrows():
-            print(f"  行 {row['行号']} -> {row['住院流水号']} {row.get('患者姓名', '')}")
+        print("\n".join(
+            f"  行 {r['行号']} -> {r['住院流水号']} {r.get('患者姓名', '')}"
+            for r in records if r["住院流水号"] in missing
+        ))
 
     if extra:
         print(f"\nℹ️ 全量中多出的 {len(extra)} 个患者（Excel 没有）：")
@@ -50,12 +71,12 @@ def main():
     full_dir = "/Users/lijiahe/Documents/Neusoft/proj/0800-互联互通/第4轮/文档整理/1.全量"
 
     print("📌 开始读取 Excel 患者号...")
-    df = load_patient_ids_from_excel(excel_path)
+    records = load_patient_ids_from_excel(excel_path)
 
     print("📌 扫描全量目录患者号...")
     full_ids = load_patient_ids_from_full(full_dir)
 
-    check_missing_patients(df, full_ids)
+    check_missing_patients(records, full_ids)
 
 
 if __name__ == "__main__":
@@ -1,14 +1,172 @@
 import os
-import shutil
+import errno
 import re
+import shutil
+import sys
+import mmap
+import tempfile
 import xml.etree.ElementTree as ET
-import pandas as pd
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from openpyxl import load_workbook
+
+
+_SD_RE = re.compile(r"SD\d+")
+_PATH_ID_RE = re.compile(r"(ZY\d+)-([^/\\]+)")
+
+_XML_FEED_CHUNK = 64 * 1024
+
+_COPY_CHUNK = 1 << 30
+_COPY_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+_HAS_FADVISE = hasattr(os, "posix_fadvise")  # macOS 没有
+_IS_LINUX = sys.platform.startswith("linux")
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.ENOTSUP, errno.EBADF, errno.ENOTSOCK}
+
+
+def fastcopy(src: str, dst: str):
+    """复制文件内容：Linux 上优先 copy_file_range（reflink/服务端复制），再 sendfile，最后 1MiB 缓冲读写；其他平台用 shutil.copyfile"""
+    src_fd = os.open(src, os.O_RDONLY)
+    try:
+        if _HAS_FADVISE:
+            os.posix_fadvise(src_fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        # 先写同目录临时文件再 os.replace：dst 可能是其他文件的硬链接，原地截断会把它们一起清空
+        # 临时文件名用固定短前缀，不随目标文件名变长（长中文名会超过 255 字节上限）
+        dst_fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dst), prefix=".fastcopy-", suffix=".tmp")
+        try:
+            if _IS_LINUX:
+                try:
+                    _copy_fd(src_fd, dst_fd)
+                finally:
+                    os.close(dst_fd)
+            else:
+                # macOS 等没有 copy_file_range，sendfile 也不能写普通文件：交给 shutil.copyfile（走 fcopyfile）
+                os.close(dst_fd)
+                shutil.copyfile(src, tmp)
+            # 与 shutil.copy 一致：保留权限位
+            os.chmod(tmp, os.fstat(src_fd).st_mode & 0o7777)
+            os.replace(tmp, dst)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+        if _HAS_FADVISE:
+            # 源文件只读一次，读完让内核尽快回收其页缓存
+            os.posix_fadvise(src_fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(src_fd)
+
+
+def _copy_fd(src_fd: int, dst_fd: int):
+    copy_file_range = getattr(os, "copy_file_range", None)
+    if copy_file_range is not None:
+        try:
+            copied = 0
+            while True:
+                n = copy_file_range(src_fd, dst_fd, _COPY_CHUNK)
+                if not n:
+                    break
+                copied += n
+            # 首次调用就返回 0 时（部分 FUSE/网络文件系统）不可信，继续走降级路径
+            if copied:
+                return
+        except OSError as e:
+            # 尚未写入任何数据时才能安全降级
+            if e.errno not in _FALLBACK_ERRNOS or os.lseek(dst_fd, 0, os.SEEK_CUR) != 0:
+                raise
+
+    sendfile = getattr(os, "sendfile", None)
+    if sendfile is not None:
+        try:
+            offset = 0
+            while True:
+                sent = sendfile(dst_fd, src_fd, offset, _COPY_CHUNK)
+                if not sent:
+                    break
+                offset += sent
+            if offset:
+                return
+        except OSError as e:
+            if e.errno not in _FALLBACK_ERRNOS or offset != 0:
+                raise
+
+    os.lseek(src_fd, 0, os.SEEK_SET)
+    os.lseek(dst_fd, 0, os.SEEK_SET)
+    buf = bytearray(1 << 20)
+    view = memoryview(buf)
+    with open(src_fd, "rb", buffering=0, closefd=False) as fsrc:
+        while True:
+            n = fsrc.readinto(buf)
+            if not n:
+                break
+            written = 0
+            while written < n:
+                written += os.write(dst_fd, view[written:n])
+
+
+def linkcopy(src: str, dst: str):
+    """优先建硬链接（同一文件系统内不复制数据），跨设备或不支持时退回 fastcopy"""
+    # 先删旧目标：重复运行时它可能与 src 共用 inode，直接截断会清空源文件
+    while True:
+        try:
+            os.unlink(dst)
+        except FileNotFoundError:
+            pass
+        try:
+            os.link(src, dst)
+            return
+        except FileExistsError:
+            # 目标又被建出来了：重新删除再链接，不能退回复制（会截断共用 inode 的文件）
+            continue
+        except OSError:
+            break
+    fastcopy(src, dst)
+
+
+def _copy_fn_for(link_mode: str):
+    if link_mode == "hardlink":
+        return linkcopy
+    if link_mode == "copy":
+        return fastcopy
+    raise ValueError(f"link_mode 只能是 'hardlink' 或 'copy'，收到: {link_mode!r}")
+
+
+def copy_batch(tasks: list, copy_fn=fastcopy):
+    """并发复制 (src, dst) 列表：先串行创建去重后的目标目录，再多线程复制"""
+    # 同一目标只保留最后一个来源（与串行复制后者覆盖一致），避免多线程同时写一个文件
+    by_dst = {dst: src for src, dst in tasks}
+    for d in dict.fromkeys(os.path.dirname(dst) for dst in by_dst):
+        os.makedirs(d, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=_COPY_WORKERS) as ex:
+        list(ex.map(lambda dst: copy_fn(by_dst[dst], dst), by_dst))
+
+
+def _cell_str(row: tuple, i: int) -> str:
+    """空单元格记为空串，整数值的浮点数按整数输出（与原 dtype=str + fillna("") 一致）"""
+    v = row[i] if i < len(row) else None
+    if v is None:
+        return ""
+    if isinstance(v, float) and v.is_integer():
+        v = int(v)
+    return str(v)
 
 
 def load_mapping(excel_path: str) -> dict:
-    df = pd.read_excel(excel_path, dtype=str).fillna("")
-    mapping = dict(zip(df["姓名"], df["住院流水号"]))
+    # 只读模式逐行读取第一个工作表（同原 read_excel 默认 sheet_name=0）的两列，不经过 DataFrame
+    wb = load_workbook(excel_path, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, ())
+        name_i, id_i = header.index("姓名"), header.index("住院流水号")
+        mapping = {}
+        for row in rows:
+            if all(v is None for v in row):
+                continue
+            mapping[_cell_str(row, name_i)] = _cell_str(row, id_i)
+    finally:
+        wb.close()
     print(f"📌 Excel 映射加载完成: {len(mapping)} 条")
     return mapping
 
@@ -16,41 +174,91 @@ def load_mapping(excel_path: str) -> dict:
 def index_files(src_dir: str, extensions=None) -> list:
     if extensions is None:
         extensions = [".xml"]
+    ext_tuple = tuple(ext.lower() for ext in extensions)
     result = []
-    for root, _, files in os.walk(src_dir):
-        for f in files:
-            if any(f.lower().endswith(ext) for ext in extensions):
-                result.append(os.path.join(root, f))
+    _scan_files(src_dir, ext_tuple, result)
     return result
 
 
+def _scan_files(d: str, ext_tuple: tuple, result: list):
+    # 与 os.walk 顺序一致：先收当前目录文件，再依次进入子目录
+    try:
+        it = os.scandir(d)
+    except OSError:
+        return
+    subdirs = []
+    with it:
+        for e in it:
+            try:
+                is_dir = e.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                if not e.is_symlink():
+                    subdirs.append(e.path)
+            elif e.name.lower().endswith(ext_tuple):
+                result.append(e.path)
+    for sub in subdirs:
+        _scan_files(sub, ext_tuple, result)
+
+
 def parse_category(filename: str) -> str:
     parts = filename.split("-")
     for i, p in enumerate(parts):
-        if p.upper() == "SD" and i + 1 < len(parts) and parts[i + 1].isdigit():
-            return f"SD-{parts[i + 1]}"
-        elif re.match(r"SD\d+", p.upper()):
-            return p.upper()
-        elif re.match(r"SD-\d+", p.upper()):
-            return p.upper()
+        up = p.upper()
+        if up == "SD":
+            if i + 1 < len(parts) and parts[i + 1].isdigit():
+                return f"SD-{parts[i + 1]}"
+        elif _SD_RE.match(up):
+            return up
+    return "UNKNOWN"
+
+
+def _is_patient_id_node(elem) -> bool:
+    tag = elem.tag
+    return (tag == "id" or tag.endswith("}id")) and elem.get("root") == "2.16.156.10011.1.1"
+
+
+def _scan_patient_id_mmap(f) -> str:
+    # 从页缓存分块喂给增量解析器，命中即停，不读入整份文件
+    # 喂 bytes 切片而不是 memoryview：解析异常会持有切片，导致 mmap 无法关闭并掩盖原始错误
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        parser = ET.XMLPullParser(events=("start",))
+        for off in range(0, len(mm), _XML_FEED_CHUNK):
+            parser.feed(mm[off:off + _XML_FEED_CHUNK])
+            for _, elem in parser.read_events():
+                if _is_patient_id_node(elem):
+                    return elem.get("extension", "UNKNOWN")
+        parser.close()
+    return "UNKNOWN"
+
+
+def _scan_patient_id_stream(f) -> str:
+    for _, elem in ET.iterparse(f, events=("start",)):
+        if _is_patient_id_node(elem):
+            return elem.get("extension", "UNKNOWN")
+        elem.clear()
     return "UNKNOWN"
 
 
 def extract_patient_id_from_xml(filepath: str) -> str:
     try:
-        tree = ET.parse(filepath)
-        root = tree.getroot()
-        id_node = root.find(".//id[@root='2.16.156.10011.1.1']")
-        if id_node is not None and "extension" in id_node.attrib:
-            return id_node.attrib["extension"]
+        with open(filepath, "rb") as f:
+            try:
+                return _scan_patient_id_mmap(f)
+            except (ValueError, OSError):
+                # 空文件或网络盘等不支持 mmap 时退回流式解析
+                f.seek(0)
+                return _scan_patient_id_stream(f)
     except Exception as e:
         print(f"⚠️ XML解析失败: {filepath}, 错误: {e}")
     return "UNKNOWN"
 
 
-def parse_patient_id_and_name(filepath: str, mapping: dict) -> tuple:
+def parse_patient_id_and_name(filepath: str, mapping: dict, category: str = None) -> tuple:
     fname = os.path.basename(filepath)
-    category = parse_category(fname)
+    if category is None:
+        category = parse_category(fname)
     parts = fname.split("-")
 
     # SD-04和SD-05 → 从文件名找姓名（跳过类型名）
@@ -67,7 +275,7 @@ def parse_patient_id_and_name(filepath: str, mapping: dict) -> tuple:
         return patient_id, name
 
     # 其他类型 → 优先路径提取
-    m = re.search(r"(ZY\d+)-([^/\\]+)", filepath)
+    m = _PATH_ID_RE.search(filepath)
     if m:
         return m.group(1), m.group(2)
 
@@ -80,98 +288,110 @@ def parse_patient_id_and_name(filepath: str, mapping: dict) -> tuple:
     return patient_id, name
 
 
-def copy_all_files(dst_dir: str, files: list, mapping: dict):
+@dataclass
+class FileIndex:
+    """全量文件的列式索引：各列表按下标一一对应"""
+    pids: list = field(default_factory=list)
+    cats: list = field(default_factory=list)
+    srcs: list = field(default_factory=list)
+    rels: list = field(default_factory=list)  # 相对目标路径：患者号-姓名/分类/文件名
+
+
+def select_limited(index: FileIndex, limit: int = 10) -> list:
+    """按 (患者号, 分类) 分组，返回每组前 limit 个文件的下标（保持原文件顺序）"""
+    counts = {}
+    selected = []
+    for i, key in enumerate(zip(index.pids, index.cats)):
+        n = counts.get(key, 0)
+        if n < limit:
+            counts[key] = n + 1
+            selected.append(i)
+    return selected
+
+
+def copy_all_and_limited(dst_dir: str, files: list, mapping: dict, link_mode: str = "hardlink"):
+    part_copy_fn = _copy_fn_for(link_mode)
     full_dir = os.path.join(dst_dir, "1.全量")
+    part_dir = os.path.join(dst_dir, "2.部分")
     os.makedirs(full_dir, exist_ok=True)
+    os.makedirs(part_dir, exist_ok=True)
+    sep = os.sep
+    full_prefix = full_dir + sep
+    part_prefix = part_dir + sep
 
-    patient_files = defaultdict(lambda: defaultdict(list))
+    index = FileIndex()
+    pids, cats, srcs, rels = index.pids, index.cats, index.srcs, index.rels
 
     for src in files:
         fname = os.path.basename(src)
-        patient_id, name = parse_patient_id_and_name(src, mapping)
         category = parse_category(fname)
+        patient_id, name = parse_patient_id_and_name(src, mapping, category)
 
         if patient_id == "UNKNOWN":
             print(f"⚠️ 未找到患者号: {fname}")
 
-        new_dir = os.path.join(full_dir, f"{patient_id}-{name}", category)
-        os.makedirs(new_dir, exist_ok=True)
-        shutil.copy(src, os.path.join(new_dir, fname))
+        pids.append(patient_id)
+        cats.append(category)
+        srcs.append(src)
+        rels.append(f"{patient_id}-{name}{sep}{category}{sep}{fname}")
 
-        patient_files[patient_id][category].append(src)
+    copy_batch([(src, full_prefix + rel) for src, rel in zip(srcs, rels)])
 
-    return patient_files
+    # 部分集：每人每类前 10 个；硬链接模式链接到全量目录里的副本，保证与目标在同一文件系统
+    link_base = full_prefix if link_mode == "hardlink" else None
+    part_tasks = [
+        (link_base + rels[i] if link_base else srcs[i], part_prefix + rels[i])
+        for i in select_limited(index)
+    ]
+    copy_batch(part_tasks, part_copy_fn)
 
 
-def copy_limited_files(dst_dir: str, patient_files: dict, mapping: dict):
-    part_dir = os.path.join(dst_dir, "2.部分")
-    os.makedirs(part_dir, exist_ok=True)
-
-    counter = defaultdict(lambda: defaultdict(int))
-
-    for patient_id, cats in patient_files.items():
-        for category, files in cats.items():
-            for src in files:
-                if counter[patient_id][category] < 10:
-                    fname = os.path.basename(src)
-                    _, name = parse_patient_id_and_name(src, mapping)
-                    new_dir = os.path.join(part_dir, f"{patient_id}-{name}", category)
-                    os.makedirs(new_dir, exist_ok=True)
-                    shutil.copy(src, os.path.join(new_dir, fname))
-                    counter[patient_id][category] += 1
-
-
-def make_validation_set(dst_dir: str):
+def make_validation_set(dst_dir: str, link_mode: str = "hardlink"):
+    copy_fn = _copy_fn_for(link_mode)
     part_dir = os.path.join(dst_dir, "2.部分")
     validation_dir = os.path.join(dst_dir, "3.校验")
     os.makedirs(validation_dir, exist_ok=True)
 
     stats = defaultdict(int)
     category_files = defaultdict(list)
+    tasks = []
 
     # 收集所有文件按分类
-    for patient in os.listdir(part_dir):
-        patient_path = os.path.join(part_dir, patient)
-        if not os.path.isdir(patient_path):
-            continue
-        for category in os.listdir(patient_path):
-            category_path = os.path.join(patient_path, category)
-            if not os.path.isdir(category_path):
+    with os.scandir(part_dir) as patients:
+        for p in patients:
+            if not p.is_dir():
                 continue
-            for f in os.listdir(category_path):
-                if f.lower().endswith(".xml"):
-                    category_files[category].append(os.path.join(category_path, f))
+            with os.scandir(p.path) as cats:
+                for c in cats:
+                    if not c.is_dir():
+                        continue
+                    with os.scandir(c.path) as fs:
+                        category_files[c.name].extend(f.path for f in fs if f.name.lower().endswith(".xml"))
 
     # 按分类拆分
     for category, files in category_files.items():
         total_files = len(files)
         dst_category_path = os.path.join(validation_dir, category)
-        os.makedirs(dst_category_path, exist_ok=True)
 
         if total_files > 100:
             # 平分逻辑
             num_folders = (total_files + 99) // 100  # 最少分多少组
-            base_size = total_files // num_folders
-            remainder = total_files % num_folders
-            start = 0
-
-            for i in range(num_folders):
-                subfolder = os.path.join(dst_category_path, f"{i+1}")
-                os.makedirs(subfolder, exist_ok=True)
-
-                # 平分：前 remainder 组多一个文件
-                size = base_size + (1 if i < remainder else 0)
-                batch_files = files[start:start + size]
-                start += size
-
-                for fpath in batch_files:
-                    shutil.copy(fpath, os.path.join(subfolder, os.path.basename(fpath)))
-                stats[f"{category}/{i+1}"] = len(batch_files)
+            base_size, remainder = divmod(total_files, num_folders)
+            # 平分：前 remainder 组多一个文件，一次算出所有分组边界
+            bounds = [i * base_size + min(i, remainder) for i in range(num_folders + 1)]
+            groups = [files[bounds[i]:bounds[i + 1]] for i in range(num_folders)]
+
+            for i, batch_files in enumerate(groups, 1):
+                subfolder = os.path.join(dst_category_path, f"{i}")
+                tasks.extend((fpath, os.path.join(subfolder, os.path.basename(fpath))) for fpath in batch_files)
+                stats[f"{category}/{i}"] = len(batch_files)
         else:
             for fpath in files:
-                shutil.copy(fpath, os.path.join(dst_category_path, os.path.basename(fpath)))
+                tasks.append((fpath, os.path.join(dst_category_path, os.path.basename(fpath))))
             stats[category] = total_files
 
+    copy_batch(tasks, copy_fn)
+
     print("\n📊 校验集统计：")
     for category, count in sorted(stats.items()):
         print(f"  {category}: {count} 个")
@@ -188,11 +408,8 @@ def main():
     file_index = index_files(src_dir, extensions=[".xml"])
     print(f"📌 共索引到 {len(file_index)} 个 .xml 文件")
 
-    print("📌 复制全量文件...")
-    patient_files = copy_all_files(dst_dir, file_index, mapping)
-
-    print("📌 复制部分文件（每人每类最多10个）...")
-    copy_limited_files(dst_dir, patient_files, mapping)
+    print("📌 复制全量文件，同时挑出部分文件（每人每类最多10个）...")
+    copy_all_and_limited(dst_dir, file_index, mapping)
 
     print("📌 整理校验文件（按 SD-xx 分类，每类 ≤100）...")
     make_validation_set(dst_dir)